@@ -0,0 +1,460 @@
+"""
+Cross-account RDS inventory: assume a role in each account, list RDS
+instances in every enabled region in parallel, and write them as CSV.
+Entry scripts pick where accounts come from and how STS is used.
+"""
+
+import csv
+import logging
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging.handlers import QueueHandler, QueueListener
+
+import boto3
+import botocore.loaders
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import AssumeRoleCredentialFetcher, DeferredRefreshableCredentials, JSONFileCache
+from botocore.exceptions import ClientError
+
+# STS strategies
+GLOBAL = "global"                        # Global STS only; regions rejecting its token are reported
+REGIONAL_FALLBACK = "regional-fallback"  # Retry those regions with region-specific STS
+
+MAX_WORKERS = int(os.environ.get("RDS_MAX_WORKERS", 32))  # Concurrent AWS calls; too many threads slow boto3 down
+
+# Shared by every client: adaptive retries absorb throttling under fan-out, and
+# the connection pool is at least MAX_WORKERS so threads never wait on it
+BOTO_CFG = Config(
+    retries={"mode": "adaptive", "max_attempts": 10},
+    max_pool_connections=max(64, MAX_WORKERS),
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=30,
+)
+
+# AssumeRole results, shared with the AWS CLI so warm runs skip STS entirely
+CREDENTIAL_CACHE = JSONFileCache(working_dir=os.path.expanduser(os.path.join("~", ".aws", "cli", "cache")))
+
+# Workers only enqueue records; a single listener thread writes them to stderr,
+# leaving stdout for the CSV inventory
+log = logging.getLogger("rds")
+
+# Service model JSON is parsed once and shared by every worker's botocore session
+DATA_LOADER = botocore.loaders.create_loader()
+
+# One HTTP connection pool per (service, region) endpoint, shared by every client
+# so accounts reuse open TLS connections instead of handshaking again
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
+
+# Region-specific STS credentials per role ARN, reused across that account's regions;
+# the per-role locks stop concurrent regions of one account assuming it twice
+_regional_creds = {}
+_regional_creds_locks = {}
+_regional_creds_lock = threading.Lock()
+
+
+def start_logging():
+    """Route the 'rds' logger through a queue to stderr. Returns (handler, listener) for stop_logging()."""
+    log_queue = queue.SimpleQueue()
+    handler = QueueHandler(log_queue)
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stderr))
+    listener.start()
+    return handler, listener
+
+
+def stop_logging(handler, listener):
+    """Flush the queued records and detach the handler added by start_logging()."""
+    listener.stop()
+    log.removeHandler(handler)
+
+
+def emit(lines):
+    """Log a block of lines as one record so it is not interleaved with other workers."""
+    log.info("%s", "\n".join(lines))
+
+
+def parse_regions(value):
+    """Parse an 'enabled_regions' CSV cell; an empty cell means unknown (None)."""
+    regions = {r.strip() for r in value.split(",") if r.strip()}
+    return regions or None
+
+
+def csv_accounts(csv_file):
+    """
+    Account source reading a CSV with column 'vendor_account_identifier'
+    (optional: 'account_name', 'enabled_regions').
+    """
+    def load(base_session):
+        # Resolve the column positions once from the header
+        with open(csv_file, mode="r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            i_id = header.index("vendor_account_identifier")
+            i_name = header.index("account_name") if "account_name" in header else None
+            # Optional comma-separated allow-list; when absent, ask the account itself
+            i_regions = header.index("enabled_regions") if "enabled_regions" in header else None
+            # Skip blank lines; optional cells may be missing from short rows
+            return [
+                {
+                    "Id": row[i_id],
+                    "Name": row[i_name] if i_name is not None and i_name < len(row) else row[i_id],
+                    "Regions": parse_regions(row[i_regions]) if i_regions is not None and i_regions < len(row) else None
+                }
+                for row in reader
+                if row
+            ]
+
+    return load
+
+
+def organization_accounts(base_session):
+    """Account source listing every ACTIVE account in the AWS Organization."""
+    org_client = base_session.client("organizations", config=BOTO_CFG)
+    return [
+        {"Id": a["Id"], "Name": a["Name"], "Regions": None}
+        for page in org_client.get_paginator("list_accounts").paginate()
+        for a in page["Accounts"]
+        if a["Status"] == "ACTIVE"
+    ]
+
+
+def discover_regions(ec2_client):
+    """
+    Fetch all active commercial regions (those opted in or not requiring opt-in).
+    Returns (regions, opt_in_regions); global STS tokens are not accepted in the latter.
+    """
+    try:
+        region_response = ec2_client.describe_regions(AllRegions=True)
+    except ClientError as e:
+        log.info("Error describing regions: %s", e)
+        return ["us-east-1"], set()  # fallback if something goes wrong
+    regions = [
+        r["RegionName"] for r in region_response["Regions"]
+        if r["OptInStatus"] in ("opt-in-not-required", "opted-in")
+    ]
+    opt_in_regions = {r["RegionName"] for r in region_response["Regions"] if r["OptInStatus"] == "opted-in"}
+    return regions, opt_in_regions
+
+
+def assumed_credentials(sts_client, source_credentials, role_arn, session_name):
+    """
+    Build credentials that call AssumeRole on first use and again shortly
+    before they expire, so long runs never hit ExpiredToken mid-way. Results
+    go through the AWS CLI's credential cache, so a rerun within the hour
+    reads them from disk instead of calling STS.
+    """
+    fetcher = AssumeRoleCredentialFetcher(
+        # sts_client already signs with source_credentials; reuse it rather than building one per call
+        client_creator=lambda service_name, **kwargs: sts_client,
+        source_credentials=source_credentials,
+        role_arn=role_arn,
+        extra_args={"RoleSessionName": session_name, "DurationSeconds": 3600},
+        cache=CREDENTIAL_CACHE,
+    )
+    return DeferredRefreshableCredentials(refresh_using=fetcher.fetch_credentials, method="assume-role")
+
+
+def session_for(creds):
+    """
+    Wrap shared refreshable credentials in a new botocore session for one task.
+    It is not wrapped in boto3.Session, which would append boto3's data path
+    to the shared loader's search paths on every call.
+    """
+    botocore_session = botocore.session.get_session()
+    botocore_session.register_component("data_loader", DATA_LOADER)
+    botocore_session._credentials = creds
+    return botocore_session
+
+
+def client_for(creds, service, region):
+    """
+    Build a client for (credentials, service, region) on a fresh session.
+    An account's regions are spread across all workers, so neither the
+    session nor the client is kept; the shared data loader keeps building
+    them cheap. Requests are signed per client, so clients for different
+    accounts can safely send them over the same endpoint's connection pool.
+    """
+    client = session_for(creds).create_client(service, region_name=region, config=BOTO_CFG)
+    with _http_sessions_lock:
+        http_session = _http_sessions.setdefault((service, region), client._endpoint.http_session)
+    client._endpoint.http_session = http_session
+    return client
+
+
+def enabled_regions(creds):
+    """
+    List the regions enabled in an assumed account via account:ListRegions.
+    Returns None if the role may not call it, so the caller can try every region.
+    """
+    account_client = client_for(creds, "account", "us-east-1")
+    try:
+        return {
+            r["RegionName"]
+            for page in account_client.get_paginator("list_regions").paginate(
+                RegionOptStatusContains=["ENABLED", "ENABLED_BY_DEFAULT"]
+            )
+            for r in page["Regions"]
+        }
+    except ClientError:
+        return None
+
+
+def list_dbs(rds_client, engines):
+    """Describe RDS instances page by page. Returns (db_id, engine, status) tuples."""
+    paginate_kwargs = {"PaginationConfig": {"PageSize": 100}}
+    if engines:
+        paginate_kwargs["Filters"] = [{"Name": "engine", "Values": engines}]
+    
+    return [
+        (db.get("DBInstanceIdentifier"), db.get("Engine"), db.get("DBInstanceStatus"))
+        for page in rds_client.get_paginator("describe_db_instances").paginate(**paginate_kwargs)
+        for db in page.get("DBInstances", [])
+    ]
+
+
+def assume_account(acct, role_name, global_sts_client, source_credentials, regions):
+    """
+    Assume the role in one account with global STS and work out which of the
+    discovered regions to list there. Returns (credentials, regions), or
+    (None, []) if the role could not be assumed.
+    """
+    account_id = acct["Id"]
+    account_name = acct["Name"]
+    role_arn = f"arn:aws:iam::{account_id}:role/{role_name}"
+    lines = [
+        "\n===============================================================",
+        f"Account: {account_name} ({account_id})",
+        f"Role ARN: {role_arn}",
+    ]
+    creds = assumed_credentials(global_sts_client, source_credentials, role_arn, "CrossAccountRDSListGlobalSTS")
+    try:
+        creds.get_frozen_credentials()  # assume now so failures are reported per account
+    except ClientError as e:
+        lines.append(f"Failed to assume role (global STS) in {account_name} ({account_id}): {e}")
+        emit(lines)
+        return None, []
+    
+    # Skip regions the account never opted into instead of probing them
+    account_regions = acct["Regions"] if acct["Regions"] is not None else enabled_regions(creds)
+    if account_regions is not None:
+        regions = [r for r in regions if r in account_regions]
+        lines.append(f"Enabled regions: {len(regions)}")
+    emit(lines)
+    return creds, regions
+
+
+def describe_one(acct, region, creds, engines):
+    """
+    List RDS instances for one (account, region) with global STS credentials.
+    Each task builds its own session and client, since sessions are not safe
+    to share between threads. Returns (rows, needs_fallback), where
+    needs_fallback means the region rejected the token (InvalidClientTokenId)
+    and needs a regional STS retry.
+    """
+    rds_client = client_for(creds, "rds", region)
+
+    lines = [f"\nListing RDS in region: {region} for {acct['Name']} ({acct['Id']}) (Global STS)"]
+    rows = []
+    needs_fallback = False
+    try:
+        rows = [(acct["Id"], acct["Name"], region) + db for db in list_dbs(rds_client, engines)]
+        lines.append(f"  RDS instances found: {len(rows)}")
+    except ClientError as e:
+        err_code = e.response["Error"]["Code"]
+        if err_code == "InvalidClientTokenId":
+            lines.append(f"  InvalidClientTokenId in {region}. Global STS token not accepted.")
+            needs_fallback = True
+        else:
+            lines.append(f"  Error describing RDS in {region}: {e}")
+    emit(lines)
+    return rows, needs_fallback
+
+
+def assume_regional(acct, role_arn, region, regional_sts_client, source_credentials):
+    """Assume the role through region-specific STS. Returns (credentials, None) or (None, error line)."""
+    creds = assumed_credentials(
+        regional_sts_client, source_credentials, role_arn, f"CrossAccountRDSListRegionalSTS-{region}"
+    )
+    try:
+        creds.get_frozen_credentials()  # assume now so failures are reported here
+        return creds, None
+    except ClientError as e:
+        err_code = e.response["Error"]["Code"]
+        if err_code == "AccessDenied":
+            return None, f"AccessDenied in region {region} for account {acct['Id']}. Skipping as disabled."
+        return None, f"Failed to assume role (regional STS) for {acct['Name']} ({acct['Id']}, {region}): {e}"
+
+
+def shared_regional_credentials(acct, role_arn, region, regional_sts_client, source_credentials):
+    """
+    Return (credentials, reused, error) for the account's shared region-specific
+    STS credentials, assuming through this region's STS if there are none yet.
+    """
+    with _regional_creds_lock:
+        role_lock = _regional_creds_locks.setdefault(role_arn, threading.Lock())
+    with role_lock:
+        creds = _regional_creds.get(role_arn)
+        if creds is not None:
+            return creds, True, None
+        creds, error = assume_regional(acct, role_arn, region, regional_sts_client, source_credentials)
+        if creds is not None:
+            _regional_creds[role_arn] = creds
+        return creds, False, error
+
+
+def describe_regional(acct, region, role_name, regional_sts_client, source_credentials, engines):
+    """
+    List RDS in a region that rejects global STS tokens. Tokens from any
+    region-specific STS endpoint are valid in every region, so the account's
+    first one is reused; the role is assumed through this region's STS only
+    if there is none yet or the region rejects it.
+    Returns (rows, False), matching describe_one; there is no further fallback.
+    """
+    acct_id = acct["Id"]
+    acct_name = acct["Name"]
+    role_arn = f"arn:aws:iam::{acct_id}:role/{role_name}"
+    lines = [f"Using region-specific STS for {acct_name} ({acct_id}) in region {region}."]
+    rows = []
+    creds, reused, error = shared_regional_credentials(acct, role_arn, region, regional_sts_client, source_credentials)
+    while True:
+        if creds is None:
+            lines.append(error)
+            break
+        
+        rds_client = client_for(creds, "rds", region)
+        lines.append(f"Listing RDS in region: {region} (Regional STS)")
+        try:
+            rows = [(acct_id, acct_name, region) + db for db in list_dbs(rds_client, engines)]
+            lines.append(f"  RDS instances found: {len(rows)}")
+        except ClientError as e:
+            if reused and e.response["Error"]["Code"] == "InvalidClientTokenId":
+                lines.append(f"  Shared regional token rejected in {region}. Assuming through this region's STS.")
+                creds, error = assume_regional(acct, role_arn, region, regional_sts_client, source_credentials)
+                reused = False
+                continue
+            lines.append(f"  Still received error describing RDS in {region}: {e}")
+        break
+    emit(lines)
+    return rows, False
+
+
+def inventory(account_source, sts_strategy, role_name, profile_name, regions=None, engines=None, max_workers=MAX_WORKERS):
+    """
+    1) Load accounts from account_source(base_session).
+    2) Use global STS to assume role_name in each account (in parallel).
+    3) For each region discovered (or given) and enabled in the account, list RDS instances (in parallel).
+       With REGIONAL_FALLBACK, opt-in regions go straight to region-specific STS.
+    4) Catch InvalidClientTokenId => with REGIONAL_FALLBACK, second pass with region-specific STS.
+    5) Catch AccessDenied => skip that region for that account.
+    Writes one CSV row per RDS instance to stdout; progress goes to stderr.
+    """
+    handler, listener = start_logging()
+    try:
+        _run_inventory(account_source, sts_strategy, role_name, profile_name, regions, engines, max_workers)
+    finally:
+        stop_logging(handler, listener)
+
+
+def _run_inventory(account_source, sts_strategy, role_name, profile_name, regions, engines, max_workers):
+    """Body of inventory(), run while its progress log is being drained."""
+    # Create a base session using your desired local profile (e.g., 'saml')
+    base_session = boto3.Session(profile_name=profile_name)
+    
+    # Region discovery and account loading are independent, so overlap them.
+    # Sessions are not thread-safe but clients are: build the ec2 client here
+    # and hand only the describe_regions call to the background thread
+    opt_in_regions = set()
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        regions_future = None
+        if regions is None:
+            ec2_client = base_session.client("ec2", region_name="us-east-1", config=BOTO_CFG)
+            regions_future = ex.submit(discover_regions, ec2_client)
+        
+        accounts = account_source(base_session)
+        
+        # Global STS client (no region_name => uses sts.amazonaws.com)
+        global_sts_client = base_session.client("sts", config=BOTO_CFG)
+        source_credentials = base_session.get_credentials()
+        
+        if regions_future is not None:
+            regions, opt_in_regions = regions_future.result()
+            log.info("Discovered regions:")
+            for r in regions:
+                log.info(" - %s", r)
+    
+    # Clients are thread-safe, so build one regional STS client per region and share it
+    regional_sts_clients = {}
+    
+    def regional_sts_client(region):
+        if region not in regional_sts_clients:
+            regional_sts_clients[region] = base_session.client("sts", region_name=region, config=BOTO_CFG)
+        return regional_sts_clients[region]
+    
+    # This will hold any (account, region) combos that fail with InvalidClientTokenId
+    fallback_list = []
+    
+    # Only the main thread writes rows, as each worker's future completes
+    out = csv.writer(sys.stdout)
+    out.writerow(["account_id", "account_name", "region", "db_id", "engine", "status"])
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        # Assume the role once per account with global STS; every region (and
+        # thread) shares these auto-refreshing credentials
+        assume_futures = {
+            ex.submit(assume_account, acct, role_name, global_sts_client, source_credentials, regions): acct
+            for acct in accounts
+        }
+        
+        # First pass: describe RDS in each region as soon as its account is assumed
+        describe_futures = {}
+        for future in as_completed(assume_futures):
+            creds, account_regions = future.result()
+            if creds is None:
+                continue
+            acct = assume_futures[future]
+            for region in account_regions:
+                if sts_strategy == REGIONAL_FALLBACK and region in opt_in_regions:
+                    # Global STS tokens are always rejected here; skip the doomed first attempt
+                    describe_future = ex.submit(
+                        describe_regional, acct, region, role_name,
+                        regional_sts_client(region), source_credentials, engines
+                    )
+                else:
+                    describe_future = ex.submit(describe_one, acct, region, creds, engines)
+                describe_futures[describe_future] = (acct, region)
+        
+        for future in as_completed(describe_futures):
+            rows, needs_fallback = future.result()
+            out.writerows(rows)
+            if needs_fallback:
+                fallback_list.append(describe_futures[future])
+    
+    # GLOBAL only reports the combos that rejected its token
+    if fallback_list and sts_strategy == GLOBAL:
+        log.info("\n======== Skipped: global STS token rejected (no regional fallback) ========\n")
+        for acct, region in fallback_list:
+            log.info("%s (%s) in region %s", acct["Name"], acct["Id"], region)
+    
+    # Second pass: only for those that failed with InvalidClientTokenId
+    if fallback_list and sts_strategy == REGIONAL_FALLBACK:
+        log.info("\n======== Second Pass: Retrying with region-specific STS ========\n")
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futures = [
+                ex.submit(
+                    describe_regional, acct, region, role_name,
+                    regional_sts_client(region), source_credentials, engines
+                )
+                for acct, region in fallback_list
+            ]
+            for future in as_completed(futures):
+                rows, _ = future.result()
+                out.writerows(rows)